@@ -1,6 +1,7 @@
 import logbook
 from logbook.queues import MultiProcessingHandler, MultiProcessingSubscriber
 from hologram.helpers import StrEnum
+from jsonrpc.jsonrpc2 import JSONRPC20BatchRequest
 
 import time
 from queue import Empty
@@ -132,7 +133,11 @@ class RPCResponse(logbook.Processor):
 
     def process(self, record):
         record.extra['response_code'] = 200
-        record.extra['request_id'] = self.response.request._id
+        request = self.response.request
+        if isinstance(request, JSONRPC20BatchRequest):
+            record.extra['request_id'] = [r._id for r in request.requests]
+        else:
+            record.extra['request_id'] = request._id
 
 
 class RequestContext(RPCRequest):
@@ -8,7 +8,11 @@ from jsonrpc.exceptions import (
 )
 from jsonrpc import JSONRPCResponseManager
 from jsonrpc.jsonrpc import JSONRPCRequest
-from jsonrpc.jsonrpc2 import JSONRPC20Response
+from jsonrpc.jsonrpc2 import (
+    JSONRPC20Response,
+    JSONRPC20BatchRequest,
+    JSONRPC20BatchResponse,
+)
 
 import dbt.exceptions
 import dbt.tracking
@@ -74,6 +78,27 @@ class ResponseManager(JSONRPCResponseManager):
 
             return cls.handle_request(request, dispatcher)
 
+    @classmethod
+    def handle_batch_request(cls, http_request, batch_request, task_manager):
+        """Handle each request in a JSON-RPC 2.0 batch in order, so every
+        request gets its own dispatcher and logging context.
+        """
+        responses = []
+        for request in batch_request.requests:
+            response = cls.handle_valid_request(
+                http_request, request, task_manager
+            )
+            # notifications don't get a response
+            if response is not None:
+                responses.append(response)
+        # a batch of only notifications gets no response at all, not an
+        # empty list
+        if not responses:
+            return None
+        batch_response = JSONRPC20BatchResponse(*responses)
+        batch_response.request = batch_request
+        return batch_response
+
     @classmethod
     def handle(cls, http_request, task_manager):
         # pretty much just copy+pasted from the original, with slight tweaks to
@@ -92,6 +117,11 @@ class ResponseManager(JSONRPCResponseManager):
         except JSONRPCInvalidRequestException:
             return JSONRPC20Response(error=JSONRPCInvalidRequest()._data)
 
+        if isinstance(request, JSONRPC20BatchRequest):
+            return cls.handle_batch_request(
+                http_request, request, task_manager
+            )
+
         return cls.handle_valid_request(
             http_request, request, task_manager
         )
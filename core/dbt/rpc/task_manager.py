@@ -5,7 +5,9 @@ import time
 import uuid
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Dict, Optional, List, Union, Set, Callable
+from typing import (
+    Any, Dict, Optional, List, Union, Set, Callable, Tuple
+)
 
 from hologram import JsonSchemaMixin
 from hologram.helpers import StrEnum
@@ -73,6 +75,8 @@ class TaskManager:
         self._rpc_task_map = {}
         self._builtins: Dict[str, UnmanagedHandler] = {}
         self.last_compile = LastCompile(status=ManifestStatus.Init)
+        # the serialized form of a LastCompile, reused across status calls
+        self._status_cache: Optional[Tuple[LastCompile, Dict[str, Any]]] = None
         self._lock = multiprocessing.Lock()
 
     def add_request(self, request_handler):
@@ -120,7 +124,12 @@ class TaskManager:
     def process_status(self) -> Dict[str, Any]:
         with self._lock:
             last_compile = self.last_compile
-        return last_compile.to_dict()
+            cached = self._status_cache
+            if cached is None or cached[0] is not last_compile:
+                cached = (last_compile, last_compile.to_dict())
+                self._status_cache = cached
+        # the logs can be long, so only copy the top level
+        return dict(cached[1])
 
     def process_listing(self, active=True, completed=False) -> Dict[str, Any]:
         included_tasks = {}
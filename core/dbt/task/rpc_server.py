@@ -180,6 +180,9 @@ class RPCServerTask(ConfiguredTask):
             jsonrpc_response = rpc.ResponseManager.handle(
                 request, self.task_manager
             )
+            if jsonrpc_response is None:
+                # notifications get an empty body, like in jsonrpc's backends
+                return Response('', mimetype='application/json')
             json_data = json.dumps(jsonrpc_response.data, cls=JSONEncoder)
             response = Response(json_data, mimetype='application/json')
             # this looks and feels dumb, but our json encoder converts decimals
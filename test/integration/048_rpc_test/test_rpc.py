@@ -1,26 +1,75 @@
 import json
 import multiprocessing
+import multiprocessing.connection
 import os
-import random
+import re
+import select
+import shutil
 import signal
 import socket
+import sys
+import tempfile
+import threading
 import time
 from base64 import standard_b64encode as b64
 from datetime import datetime
+from functools import lru_cache
+from unittest import mock
 
 import requests
 from pytest import mark
 
-from test.integration.base import DBTIntegrationTest, use_profile
+from test.integration.base import DBTIntegrationTest, use_profile, normalize
 from dbt.logger import log_manager
 from dbt.main import handle_and_check
 
 
-class ServerProcess(multiprocessing.Process):
-    def __init__(self, port, profiles_dir, cli_vars=None):
-        self.port = port
+if sys.platform == 'win32':
+    _CTX = multiprocessing.get_context('spawn')
+else:
+    # start servers from a forkserver that has already imported dbt, instead
+    # of forking the whole test process every time.
+    _CTX = multiprocessing.get_context('forkserver')
+    _CTX.set_forkserver_preload(
+        ['dbt.main', 'dbt.logger', 'dbt.task.rpc_server']
+    )
+
+
+_HOST = '127.0.0.1'
+
+
+def _bind_listener():
+    # let the OS pick a free port. SO_REUSEADDR is left off, so the port
+    # can't be one that is still in use by a lingering connection.
+    sock = socket.socket()
+    sock.bind((_HOST, 0))
+    sock.listen(128)
+    return sock
+
+
+class ServerProcess(_CTX.Process):
+    def __init__(self, profiles_dir, cli_vars=None, cwd=None):
+        # bind the server's socket here and hand it to the child, so nothing
+        # else can take the port before the server starts listening on it.
+        listener = _bind_listener()
+        self.port = listener.getsockname()[1]
+        if os.name == 'nt':
+            # werkzeug can't take over a socket on windows, just use the port
+            listener.close()
+            listener = None
+        self._listener = listener
+        self.jsonrpc_url = f'http://{_HOST}:{self.port}/jsonrpc'
+        if cwd is None:
+            cwd = os.getcwd()
+        self.cwd = cwd
+        self.env = dict(os.environ)
+        # the most recent status result, for diagnostics
+        self._last_status = None
+        # the error from the most recent failed status request, if any
+        self._last_error = None
         handle_and_check_args = [
             '--strict', 'rpc', '--log-cache-events',
+            '--host', _HOST,
             '--port', str(self.port),
             '--profiles-dir', profiles_dir
         ]
@@ -32,80 +81,194 @@ class ServerProcess(multiprocessing.Process):
             name='ServerProcess')
 
     def run(self):
+        # the child doesn't inherit our current environment or working
+        # directory, so bring over the ones we had when it was created.
+        os.environ.clear()
+        os.environ.update(self.env)
+        os.chdir(self.cwd)
+        if self._listener is not None:
+            # werkzeug serves on this socket instead of binding its own
+            os.environ['WERKZEUG_SERVER_FD'] = str(self._listener.fileno())
         log_manager.reset_handlers()
         # run server tests in stderr mode
         log_manager.stderr_console()
         return super().run()
 
     def can_connect(self):
+        # connect without blocking and wait at most 50ms for it to finish
         sock = socket.socket()
+        sock.setblocking(False)
         try:
-            sock.connect(('localhost', self.port))
-        except socket.error:
-            return False
-        sock.close()
-        return True
+            sock.connect_ex((_HOST, self.port))
+            _, writable, _ = select.select([], [sock], [], 0.05)
+            if not writable:
+                return False
+            # refused connections are writable too, check the result
+            error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            return error == 0
+        finally:
+            sock.close()
 
     def _compare_result(self, result):
         return result['result']['status'] == 'ready'
 
     def status_ok(self):
-        result = query_url(
-            'http://localhost:{}/jsonrpc'.format(self.port),
-            {'method': 'status', 'id': 1, 'jsonrpc': 2.0}
-        ).json()
+        result = _json(query_url(
+            self.jsonrpc_url,
+            _STATUS_QUERY,
+            timeout=1
+        ))
+        self._last_status = result
         return self._compare_result(result)
 
     def is_up(self):
-        if not self.can_connect():
+        # a successful status request implies we can connect, so don't
+        # bother probing the socket separately
+        try:
+            ok = self.status_ok()
+        except (requests.ConnectionError, requests.Timeout, ValueError) as exc:
+            self._last_error = exc
             return False
-        return self.status_ok()
+        self._last_error = None
+        return ok
+
+    def _wait_for_ready(self, timeout=10):
+        # the server is usually up quickly, so start polling fast and back off
+        delay = 0.025
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.is_up():
+                return True
+            # sleep on the process sentinel, so we wake up as soon as the
+            # server dies instead of polling it until the deadline
+            if multiprocessing.connection.wait([self.sentinel], delay):
+                return False
+            delay = min(delay * 1.5, 0.5)
+        return False
 
     def start(self):
         super().start()
-        for _ in range(20):
-            if self.is_up():
-                break
-            time.sleep(0.5)
-        if not self.can_connect():
+        if self._listener is not None:
+            # the child has its own copy now
+            self._listener.close()
+        if self._wait_for_ready():
+            return
+        if not self.is_alive():
+            raise Exception(
+                'server exited with code {}'.format(self.exitcode)
+            )
+        # elsewhere, the server inherits a socket that is already listening,
+        # so connecting succeeds as long as it's alive and tells us nothing.
+        if os.name == 'nt' and not self.can_connect():
             raise Exception('server never appeared!')
-        status_result = query_url(
-            'http://localhost:{}/jsonrpc'.format(self.port),
-            {'method': 'status', 'id': 1, 'jsonrpc': 2.0}
-        ).json()
-        if not self._compare_result(status_result):
-            raise Exception('Got invalid status result: {}'.format(status_result))
+        if self._last_error is not None:
+            raise Exception(
+                'status request failed: {!r}'.format(self._last_error)
+            )
+        raise Exception(
+            'Got invalid status result: {}'.format(self._last_status)
+        )
+
+
+_HEADERS = {'content-type': 'application/json'}
+# share one session instead of having requests.post() build one per query.
+# The server (werkzeug 0.14) speaks HTTP/1.0 and closes the connection after
+# every response, so each query still opens a new connection.
+_SESSION = requests.Session()
+
+
+def _encode_query(query):
+    return json.dumps(query).encode('utf-8')
+
+
+def query_url(url, query, timeout=None):
+    # queries may be pre-encoded
+    if isinstance(query, bytes):
+        data = query
+    else:
+        data = _encode_query(query)
+    return _SESSION.post(url, headers=_HEADERS, data=data, timeout=timeout)
 
 
-def query_url(url, query):
-    headers = {'content-type': 'application/json'}
-    return requests.post(url, headers=headers, data=json.dumps(query))
+def _static_query(method, **params):
+    return _encode_query(
+        {'jsonrpc': '2.0', 'method': method, 'params': params, 'id': 1}
+    )
 
 
-class BackgroundQueryProcess(multiprocessing.Process):
+# these are polled in loops, so only build and encode them once
+_STATUS_QUERY = _static_query('status')
+_PS_QUERIES = {
+    (completed, active): _static_query(
+        'ps', completed=completed, active=active
+    )
+    for completed in (True, False)
+    for active in (True, False)
+}
+
+
+def _json(response):
+    # skip the encoding detection in response.json(), the server always
+    # sends utf-8
+    return json.loads(response.content)
+
+
+class BackgroundQueryThread(threading.Thread):
     def __init__(self, query, url, group=None, name=None):
-        parent, child = multiprocessing.Pipe()
-        self.parent_pipe = parent
-        self.child_pipe = child
         self.query = query
         self.url = url
-        super().__init__(group=group, name=name)
+        self._content = None
+        self._error = None
+        self._done = threading.Event()
+        super().__init__(group=group, name=name, daemon=True)
 
     def run(self):
         try:
-            result = query_url(self.url, self.query).json()
+            # keep the raw bytes, they're only decoded if someone waits
+            self._content = query_url(self.url, self.query).content
         except Exception as exc:
-            self.child_pipe.send(('error', str(exc)))
-        else:
-            self.child_pipe.send(('result', result))
-
-    def wait_result(self):
-        result_type, result = self.parent_pipe.recv()
+            self._error = exc
+        finally:
+            self._done.set()
+
+    def wait_done(self, timeout=None):
+        """Wait up to `timeout` seconds for the query to finish, and return
+        whether it did.
+        """
+        return self._done.wait(timeout)
+
+    def wait_result(self, timeout=None):
+        if not self.wait_done(timeout):
+            raise TimeoutError(
+                'query {} did not finish in {}s'.format(self.name, timeout)
+            )
         self.join()
-        if result_type == 'error':
-            raise Exception(result)
+        if self._error is not None:
+            raise self._error
         else:
-            return result
+            return json.loads(self._content)
+
+
+@lru_cache(maxsize=256)
+def _encode_sql(sql, macros):
+    # the same sql and macros get sent over and over, only encode them once
+    body = (sql or '') + (macros or '')
+    return b64(body.encode('utf-8')).decode('utf-8')
+
+
+# the timestamp format the server uses, '%Y-%m-%dT%H:%M:%S.%fZ'
+_TIMESTAMP_RE = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})\.(\d{1,6})Z$'
+)
+
+
+def _parse_ts(ts):
+    # much faster than datetime.strptime, which parses the format every time
+    match = _TIMESTAMP_RE.match(ts)
+    if match is None:
+        raise ValueError('invalid timestamp: {!r}'.format(ts))
+    *parts, fraction = match.groups()
+    return datetime(*map(int, parts), int(fraction.ljust(6, '0')))
 
 
 _select_from_ephemeral = '''with __dbt__CTE__ephemeral_model as (
@@ -116,6 +279,10 @@ select 1 as id
 
 
 def addr_in_use(err, *args):
+    # only windows servers bind the port themselves, after we picked it, so
+    # it can be taken in between. Elsewhere, they're handed the bound socket.
+    if os.name != 'nt':
+        return False
     msg = str(err)
     if 'Address already in use' in msg:
         return True
@@ -127,28 +294,128 @@ def addr_in_use(err, *args):
 class HasRPCServer(DBTIntegrationTest):
     ServerProcess = ServerProcess
     should_seed = True
+    # if True, start one server per test class instead of one per test.
+    share_server = False
+    _shared_server = None
+    _shared_server_root = None
 
     def setUp(self):
         super().setUp()
-        os.environ['DBT_TEST_SCHEMA_NAME_VARIABLE'] = 'test_run_schema'
+        env_patcher = mock.patch.dict(
+            os.environ, {'DBT_TEST_SCHEMA_NAME_VARIABLE': 'test_run_schema'}
+        )
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
         if self.should_seed:
             self.run_dbt_with_vars(['seed'], strict=False)
-        port = random.randint(20000, 65535)
-        self._server = self.ServerProcess(
-            cli_vars='{{test_run_schema: {}}}'.format(self.unique_schema()),
-            profiles_dir=self.test_root_dir,
-            port=port
-        )
-        self._server.start()
+        if self.share_server:
+            self._server = self._get_shared_server()
+        else:
+            self._server = self._start_server(self.test_root_dir)
+        self._test_started = time.time()
         self.background_queries = []
 
     def tearDown(self):
-        del os.environ['DBT_TEST_SCHEMA_NAME_VARIABLE']
-        self._server.terminate()
+        if self.share_server:
+            self._kill_active_tasks()
+        else:
+            self._stop_server(self._server)
+        # threads can't be terminated, but the server-side work was either
+        # killed or went away with the server, so they'll finish shortly.
+        # They all wind down at once, so wait for them against one deadline
+        # instead of one timeout each.
+        deadline = time.monotonic() + 1
         for query in self.background_queries:
-            query.terminate()
+            query.join(timeout=max(deadline - time.monotonic(), 0))
         super().tearDown()
 
+    @staticmethod
+    def _stop_server(server, timeout=10):
+        # reap the server before the schema is dropped, so none of its
+        # connections are left behind. If it ignores SIGTERM, kill it.
+        server.terminate()
+        server.join(timeout=timeout)
+        if server.is_alive() and os.name != 'nt':
+            os.kill(server.pid, signal.SIGKILL)
+            server.join()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls._shared_server is not None:
+            # stop it before removing the project it's still running from
+            cls._stop_server(cls._shared_server)
+            cls._shared_server = None
+        if cls._shared_server_root is not None:
+            shutil.rmtree(cls._shared_server_root, ignore_errors=True)
+            cls._shared_server_root = None
+        super().tearDownClass()
+
+    def _start_server(self, project_root):
+        server = self.ServerProcess(
+            cli_vars='{{test_run_schema: {}}}'.format(self.unique_schema()),
+            profiles_dir=project_root,
+            cwd=project_root,
+        )
+        server.start()
+        return server
+
+    def _get_shared_server(self):
+        cls = type(self)
+        if cls._shared_server is not None and cls._shared_server.is_alive():
+            return cls._shared_server
+
+        if cls._shared_server_root is None:
+            # each test's root directory is removed when it finishes, so give
+            # the server a copy of its own that lives as long as the class.
+            cls._shared_server_root = normalize(
+                tempfile.mkdtemp(prefix='dbt-int-test-rpc-')
+            )
+        project_root = os.path.join(cls._shared_server_root, 'project')
+        shutil.rmtree(project_root, ignore_errors=True)
+        shutil.copytree(self.test_root_dir, project_root, symlinks=True)
+        cls._shared_server = self._start_server(project_root)
+        return cls._shared_server
+
+    def _active_task_ids(self):
+        result = self.query('ps', completed=False, active=True).json()
+        return [
+            row['task_id']
+            for row in result.get('result', {}).get('rows', [])
+        ]
+
+    def _kill_active_tasks(self, timeout=10):
+        # don't leave tasks running on a shared server for the next test.
+        # Each task runs in its own process with its own connections, so wait
+        # for them to finish too: the test's schema is dropped after this.
+        # The server process itself closes its connections before it starts
+        # any task, so it doesn't need to be stopped.
+        if os.name == 'nt' or not self._server.is_alive():
+            return
+        for task_id in self._active_task_ids():
+            self.query('kill', task_id=task_id)
+
+        deadline = time.monotonic() + timeout
+        while self._active_task_ids():
+            if time.monotonic() > deadline:
+                raise Exception(
+                    'tasks still running {}s after being killed'
+                    .format(timeout)
+                )
+            time.sleep(0.05)
+
+    def query_ps(self, completed, active):
+        """Query 'ps' and return its result with only the rows for tasks
+        that were started during this test, as the server may be shared.
+        """
+        result = self.assertIsResult(
+            _json(query_url(self.url, _PS_QUERIES[completed, active]))
+        )
+        result['rows'] = [
+            row for row in result['rows']
+            if row['start'] is None or row['start'] >= self._test_started
+        ]
+        return result
+
     @property
     def schema(self):
         return "rpc_048"
@@ -173,15 +440,8 @@ class HasRPCServer(DBTIntegrationTest):
     def build_query(
         self, method, kwargs, sql=None, test_request_id=1, macros=None
     ):
-        body_data = ''
-        if sql is not None:
-            body_data += sql
-
-        if macros is not None:
-            body_data += macros
-
         if sql is not None or macros is not None:
-            kwargs['sql'] = b64(body_data.encode('utf-8')).decode('utf-8')
+            kwargs['sql'] = _encode_sql(sql, macros)
 
         return {
             'jsonrpc': '2.0',
@@ -192,19 +452,30 @@ class HasRPCServer(DBTIntegrationTest):
 
     @property
     def url(self):
-        return 'http://localhost:{}/jsonrpc'.format(self._server.port)
+        return self._server.jsonrpc_url
 
     def query(self, _method, _sql=None, _test_request_id=1, macros=None, **kwargs):
         built = self.build_query(_method, kwargs, _sql, _test_request_id, macros)
         return query_url(self.url, built)
 
-    def handle_result(self, bg_query, pipe):
-        result_type, result = pipe.recv()
-        bg_query.join()
-        if result_type == 'error':
-            raise result
-        else:
-            return result
+    def query_batch(self, *calls):
+        """Send (method, sql, kwargs) calls as one JSON-RPC batch request and
+        return the decoded responses in call order. Each call's request ID is
+        its 1-based position in the batch.
+        """
+        built = []
+        for request_id, (method, sql, kwargs) in enumerate(calls, 1):
+            kwargs = dict(kwargs)
+            macros = kwargs.pop('macros', None)
+            built.append(
+                self.build_query(method, kwargs, sql, request_id, macros)
+            )
+        responses = query_url(self.url, built).json()
+        # errors about the batch as a whole come back as a single response
+        self.assertIsInstance(
+            responses, list, 'expected a batch response, got {}'.format(responses)
+        )
+        return sorted(responses, key=lambda r: r['id'])
 
     def background_query(
         self, _method, _sql=None, _test_request_id=1, _block=False, macros=None, **kwargs
@@ -212,11 +483,10 @@ class HasRPCServer(DBTIntegrationTest):
         built = self.build_query(_method, kwargs, _sql, _test_request_id,
                                  macros)
 
-        url = 'http://localhost:{}/jsonrpc'.format(self._server.port)
         name = _method
         if 'name' in kwargs:
             name += ' ' + kwargs['name']
-        bg_query = BackgroundQueryProcess(built, url, name=name)
+        bg_query = BackgroundQueryThread(built, self.url, name=name)
         self.background_queries.append(bg_query)
         bg_query.start()
         return bg_query
@@ -230,8 +500,8 @@ class HasRPCServer(DBTIntegrationTest):
             self.assertEqual(timing['name'], expected_name)
             self.assertIn('started_at', timing)
             self.assertIn('completed_at', timing)
-            datetime.strptime(timing['started_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
-            datetime.strptime(timing['completed_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
+            _parse_ts(timing['started_at'])
+            _parse_ts(timing['completed_at'])
 
     def assertIsResult(self, data, id_=1):
         self.assertEqual(data['id'], id_)
@@ -254,8 +524,8 @@ class HasRPCServer(DBTIntegrationTest):
         self.assertEqual(error['code'], code)
         return error
 
-    def assertIsErrorWith(self, data, code, message, error_data):
-        error = self.assertIsErrorWithCode(data, code)
+    def assertIsErrorWith(self, data, code, message, error_data, id_=1):
+        error = self.assertIsErrorWithCode(data, code, id_)
         if message is not None:
             self.assertEqual(error['message'], message)
 
@@ -264,10 +534,10 @@ class HasRPCServer(DBTIntegrationTest):
         else:
             return error.get('data')
 
-    def assertResultHasSql(self, data, raw_sql, compiled_sql=None):
+    def assertResultHasSql(self, data, raw_sql, compiled_sql=None, id_=1):
         if compiled_sql is None:
             compiled_sql = raw_sql
-        result = self.assertIsResult(data)
+        result = self.assertIsResult(data, id_)
         self.assertIn('logs', result)
         self.assertTrue(len(result['logs']) > 0)
         self.assertIn('raw_sql', result)
@@ -276,15 +546,15 @@ class HasRPCServer(DBTIntegrationTest):
         self.assertEqual(result['compiled_sql'], compiled_sql)
         return result
 
-    def assertSuccessfulCompilationResult(self, data, raw_sql, compiled_sql=None):
-        result = self.assertResultHasSql(data, raw_sql, compiled_sql)
+    def assertSuccessfulCompilationResult(self, data, raw_sql, compiled_sql=None, id_=1):
+        result = self.assertResultHasSql(data, raw_sql, compiled_sql, id_)
         self.assertNotIn('table', result)
         # compile results still have an 'execute' timing, it just represents
         # the time to construct a result object.
         self.assertResultHasTimings(result, 'compile', 'execute')
 
-    def assertSuccessfulRunResult(self, data, raw_sql, compiled_sql=None, table=None):
-        result = self.assertResultHasSql(data, raw_sql, compiled_sql)
+    def assertSuccessfulRunResult(self, data, raw_sql, compiled_sql=None, table=None, id_=1):
+        result = self.assertResultHasSql(data, raw_sql, compiled_sql, id_)
         self.assertIn('table', result)
         if table is not None:
             self.assertEqual(result['table'], table)
@@ -293,109 +563,181 @@ class HasRPCServer(DBTIntegrationTest):
 
 @mark.flaky(rerun_filter=addr_in_use)
 class TestRPCServer(HasRPCServer):
+    share_server = True
+
     @use_profile('postgres')
     def test_compile_postgres(self):
-        trivial = self.query(
-            'compile',
-            'select 1 as id',
-            name='foo'
-        ).json()
+        (
+            trivial,
+            ref,
+            source,
+            macro,
+            macro_override,
+            macro_override_with_if_statement,
+            ephemeral,
+        ) = self.query_batch(
+            ('compile', 'select 1 as id', {'name': 'foo'}),
+            (
+                'compile',
+                'select * from {{ ref("descendant_model") }}',
+                {'name': 'foo'},
+            ),
+            (
+                'compile',
+                'select * from {{ source("test_source", "test_table") }}',
+                {'name': 'foo'},
+            ),
+            (
+                'compile',
+                'select {{ my_macro() }}',
+                {
+                    'name': 'foo',
+                    'macros': '{% macro my_macro() %}1 as id{% endmacro %}',
+                },
+            ),
+            (
+                'compile',
+                'select {{ happy_little_macro() }}',
+                {
+                    'name': 'foo',
+                    'macros': '{% macro override_me() %}2 as id{% endmacro %}',
+                },
+            ),
+            (
+                'compile',
+                '{% if True %}select {{ happy_little_macro() }}{% endif %}',
+                {
+                    'name': 'foo',
+                    'macros': '{% macro override_me() %}2 as id{% endmacro %}',
+                },
+            ),
+            (
+                'compile',
+                'select * from {{ ref("ephemeral_model") }}',
+                {'name': 'foo'},
+            ),
+        )
         self.assertSuccessfulCompilationResult(
-            trivial, 'select 1 as id'
+            trivial, 'select 1 as id', id_=1
         )
 
-        ref = self.query(
-            'compile',
-            'select * from {{ ref("descendant_model") }}',
-            name='foo'
-        ).json()
         self.assertSuccessfulCompilationResult(
             ref,
             'select * from {{ ref("descendant_model") }}',
             compiled_sql='select * from "{}"."{}"."descendant_model"'.format(
                 self.default_database,
-                self.unique_schema())
+                self.unique_schema()),
+            id_=2
         )
 
-        source = self.query(
-            'compile',
-            'select * from {{ source("test_source", "test_table") }}',
-            name='foo'
-        ).json()
         self.assertSuccessfulCompilationResult(
             source,
             'select * from {{ source("test_source", "test_table") }}',
             compiled_sql='select * from "{}"."{}"."source"'.format(
                 self.default_database,
-                self.unique_schema())
-            )
+                self.unique_schema()),
+            id_=3
+        )
 
-        macro = self.query(
-            'compile',
-            'select {{ my_macro() }}',
-            name='foo',
-            macros='{% macro my_macro() %}1 as id{% endmacro %}'
-        ).json()
         self.assertSuccessfulCompilationResult(
             macro,
             'select {{ my_macro() }}',
-            compiled_sql='select 1 as id'
+            compiled_sql='select 1 as id',
+            id_=4
         )
 
-        macro_override = self.query(
-            'compile',
-            'select {{ happy_little_macro() }}',
-            name='foo',
-            macros='{% macro override_me() %}2 as id{% endmacro %}'
-        ).json()
         self.assertSuccessfulCompilationResult(
             macro_override,
             'select {{ happy_little_macro() }}',
-            compiled_sql='select 2 as id'
+            compiled_sql='select 2 as id',
+            id_=5
         )
 
-        macro_override_with_if_statement = self.query(
-            'compile',
-            '{% if True %}select {{ happy_little_macro() }}{% endif %}',
-            name='foo',
-            macros='{% macro override_me() %}2 as id{% endmacro %}'
-        ).json()
         self.assertSuccessfulCompilationResult(
             macro_override_with_if_statement,
             '{% if True %}select {{ happy_little_macro() }}{% endif %}',
-            compiled_sql='select 2 as id'
+            compiled_sql='select 2 as id',
+            id_=6
         )
 
-        ephemeral = self.query(
-            'compile',
-            'select * from {{ ref("ephemeral_model") }}',
-            name='foo'
-        ).json()
         self.assertSuccessfulCompilationResult(
             ephemeral,
             'select * from {{ ref("ephemeral_model") }}',
-            compiled_sql=_select_from_ephemeral
+            compiled_sql=_select_from_ephemeral,
+            id_=7
         )
 
     @use_profile('postgres')
     def test_run_postgres(self):
-        # seed + run dbt to make models before using them!
-        self.run_dbt_with_vars(['seed'])
+        # setUp already seeded, run dbt to make models before using them!
         self.run_dbt_with_vars(['run'])
-        data = self.query(
-            'run',
-            'select 1 as id',
-            name='foo'
-        ).json()
+        (
+            data,
+            ref,
+            source,
+            macro,
+            macro_override,
+            macro_override_with_if_statement,
+            macro_with_raw_statement,
+            macro_with_comment,
+            ephemeral,
+        ) = self.query_batch(
+            ('run', 'select 1 as id', {'name': 'foo'}),
+            (
+                'run',
+                'select * from {{ ref("descendant_model") }} order by updated_at limit 1',
+                {'name': 'foo'},
+            ),
+            (
+                'run',
+                'select * from {{ source("test_source", "test_table") }} order by updated_at limit 1',
+                {'name': 'foo'},
+            ),
+            (
+                'run',
+                'select {{ my_macro() }}',
+                {
+                    'name': 'foo',
+                    'macros': '{% macro my_macro() %}1 as id{% endmacro %}',
+                },
+            ),
+            (
+                'run',
+                'select {{ happy_little_macro() }}',
+                {
+                    'name': 'foo',
+                    'macros': '{% macro override_me() %}2 as id{% endmacro %}',
+                },
+            ),
+            (
+                'run',
+                '{% if True %}select {{ happy_little_macro() }}{% endif %}',
+                {
+                    'name': 'foo',
+                    'macros': '{% macro override_me() %}2 as id{% endmacro %}',
+                },
+            ),
+            (
+                'run',
+                '{% raw %}select 1 as{% endraw %}{{ test_macros() }}{% macro test_macros() %} id{% endmacro %}',
+                {'name': 'foo'},
+            ),
+            (
+                'run',
+                '{% raw %}select 1 {% endraw %}{{ test_macros() }} {# my comment #}{% macro test_macros() -%} as{% endmacro %} id{# another comment #}',
+                {'name': 'foo'},
+            ),
+            (
+                'run',
+                'select * from {{ ref("ephemeral_model") }}',
+                {'name': 'foo'},
+            ),
+        )
         self.assertSuccessfulRunResult(
-            data, 'select 1 as id', table={'column_names': ['id'], 'rows': [[1.0]]}
+            data, 'select 1 as id', table={'column_names': ['id'], 'rows': [[1.0]]},
+            id_=1
         )
 
-        ref = self.query(
-            'run',
-            'select * from {{ ref("descendant_model") }} order by updated_at limit 1',
-            name='foo'
-        ).json()
         self.assertSuccessfulRunResult(
             ref,
             'select * from {{ ref("descendant_model") }} order by updated_at limit 1',
@@ -405,14 +747,10 @@ class TestRPCServer(HasRPCServer):
             table={
                 'column_names': ['favorite_color', 'id', 'first_name', 'email', 'ip_address', 'updated_at'],
                 'rows': [['blue', 38.0, 'Gary',  'gray11@statcounter.com', "'40.193.124.56'", '1970-01-27T10:04:51']],
-            }
+            },
+            id_=2
         )
 
-        source = self.query(
-            'run',
-            'select * from {{ source("test_source", "test_table") }} order by updated_at limit 1',
-            name='foo'
-        ).json()
         self.assertSuccessfulRunResult(
             source,
             'select * from {{ source("test_source", "test_table") }} order by updated_at limit 1',
@@ -422,82 +760,56 @@ class TestRPCServer(HasRPCServer):
             table={
                 'column_names': ['favorite_color', 'id', 'first_name', 'email', 'ip_address', 'updated_at'],
                 'rows': [['blue', 38.0, 'Gary',  'gray11@statcounter.com', "'40.193.124.56'", '1970-01-27T10:04:51']],
-            }
+            },
+            id_=3
         )
 
-        macro = self.query(
-            'run',
-            'select {{ my_macro() }}',
-            name='foo',
-            macros='{% macro my_macro() %}1 as id{% endmacro %}'
-        ).json()
         self.assertSuccessfulRunResult(
             macro,
             raw_sql='select {{ my_macro() }}',
             compiled_sql='select 1 as id',
-            table={'column_names': ['id'], 'rows': [[1.0]]}
+            table={'column_names': ['id'], 'rows': [[1.0]]},
+            id_=4
         )
 
-        macro_override = self.query(
-            'run',
-            'select {{ happy_little_macro() }}',
-            name='foo',
-            macros='{% macro override_me() %}2 as id{% endmacro %}'
-        ).json()
         self.assertSuccessfulRunResult(
             macro_override,
             raw_sql='select {{ happy_little_macro() }}',
             compiled_sql='select 2 as id',
-            table={'column_names': ['id'], 'rows': [[2.0]]}
+            table={'column_names': ['id'], 'rows': [[2.0]]},
+            id_=5
         )
 
-        macro_override_with_if_statement = self.query(
-            'run',
-            '{% if True %}select {{ happy_little_macro() }}{% endif %}',
-            name='foo',
-            macros='{% macro override_me() %}2 as id{% endmacro %}'
-        ).json()
         self.assertSuccessfulRunResult(
             macro_override_with_if_statement,
             '{% if True %}select {{ happy_little_macro() }}{% endif %}',
             compiled_sql='select 2 as id',
-            table={'column_names': ['id'], 'rows': [[2.0]]}
+            table={'column_names': ['id'], 'rows': [[2.0]]},
+            id_=6
         )
 
-        macro_with_raw_statement = self.query(
-            'run',
-            '{% raw %}select 1 as{% endraw %}{{ test_macros() }}{% macro test_macros() %} id{% endmacro %}',
-            name='foo'
-        ).json()
         self.assertSuccessfulRunResult(
             macro_with_raw_statement,
             '{% raw %}select 1 as{% endraw %}{{ test_macros() }}',
             compiled_sql='select 1 as id',
-            table={'column_names': ['id'], 'rows': [[1.0]]}
+            table={'column_names': ['id'], 'rows': [[1.0]]},
+            id_=7
         )
 
-        macro_with_comment = self.query(
-            'run',
-            '{% raw %}select 1 {% endraw %}{{ test_macros() }} {# my comment #}{% macro test_macros() -%} as{% endmacro %} id{# another comment #}',
-            name='foo'
-        ).json()
         self.assertSuccessfulRunResult(
             macro_with_comment,
             '{% raw %}select 1 {% endraw %}{{ test_macros() }} {# my comment #} id{# another comment #}',
             compiled_sql='select 1 as  id',
-            table={'column_names': ['id'], 'rows': [[1.0]]}
+            table={'column_names': ['id'], 'rows': [[1.0]]},
+            id_=8
         )
 
-        ephemeral = self.query(
-            'run',
-            'select * from {{ ref("ephemeral_model") }}',
-            name='foo'
-        ).json()
         self.assertSuccessfulRunResult(
             ephemeral,
             raw_sql='select * from {{ ref("ephemeral_model") }}',
             compiled_sql=_select_from_ephemeral,
-            table={'column_names': ['id'], 'rows': [[1.0]]}
+            table={'column_names': ['id'], 'rows': [[1.0]]},
+            id_=9
         )
 
     @mark.skipif(os.name == 'nt', reason='"kill" not supported on windows')
@@ -508,12 +820,10 @@ class TestRPCServer(HasRPCServer):
         self.assertIsResult(done_query)
         pg_sleeper, sleep_task_id, request_id = self._get_sleep_query()
 
-        empty_ps_result = self.query('ps', completed=False, active=False).json()
-        result = self.assertIsResult(empty_ps_result)
+        result = self.query_ps(completed=False, active=False)
         self.assertEqual(len(result['rows']), 0)
 
-        sleeper_ps_result = self.query('ps', completed=False, active=True).json()
-        result = self.assertIsResult(sleeper_ps_result)
+        result = self.query_ps(completed=False, active=True)
         self.assertEqual(len(result['rows']), 1)
         rowdict = result['rows']
         self.assertEqual(rowdict[0]['request_id'], request_id)
@@ -521,8 +831,7 @@ class TestRPCServer(HasRPCServer):
         self.assertEqual(rowdict[0]['state'], 'running')
         self.assertEqual(rowdict[0]['timeout'], None)
 
-        complete_ps_result = self.query('ps', completed=True, active=False).json()
-        result = self.assertIsResult(complete_ps_result)
+        result = self.query_ps(completed=True, active=False)
         self.assertEqual(len(result['rows']), 1)
         rowdict = result['rows']
         self.assertEqual(rowdict[0]['request_id'], 1)
@@ -530,8 +839,7 @@ class TestRPCServer(HasRPCServer):
         self.assertEqual(rowdict[0]['state'], 'finished')
         self.assertEqual(rowdict[0]['timeout'], None)
 
-        all_ps_result = self.query('ps', completed=True, active=True).json()
-        result = self.assertIsResult(all_ps_result)
+        result = self.query_ps(completed=True, active=True)
         self.assertEqual(len(result['rows']), 2)
         rowdict = result['rows']
         rowdict.sort(key=lambda r: r['start'])
@@ -551,7 +859,8 @@ class TestRPCServer(HasRPCServer):
         result = self.assertIsResult(kill_result)
         self.assertEqual(result['state'], 'killed')
 
-        sleeper_result = pg_sleeper.wait_result()
+        # a killed task responds right away, the timeout is just a safety net
+        sleeper_result = pg_sleeper.wait_result(timeout=10)
         error = self.assertIsErrorWithCode(sleeper_result, 10009, request_id)
         self.assertEqual(error['message'], 'RPC process killed')
         self.assertIn('data', error)
@@ -569,10 +878,18 @@ class TestRPCServer(HasRPCServer):
             name='sleeper',
         )
 
-        for _ in range(20):
-            time.sleep(0.2)
-            sleeper_ps_result = self.query('ps', completed=False, active=True).json()
-            result = self.assertIsResult(sleeper_ps_result)
+        delay = 0.05
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            # if the query returns, it's never going to show up as running
+            if pg_sleeper.wait_done(delay):
+                self.assertTrue(
+                    False,
+                    'request ID finished before it was found running: {}'
+                    .format(pg_sleeper.wait_result())
+                )
+            delay = min(delay * 1.5, 0.5)
+            result = self.query_ps(completed=False, active=True)
             rows = result['rows']
             for row in rows:
                 if row['request_id'] == request_id and row['state'] == 'running':
@@ -580,6 +897,21 @@ class TestRPCServer(HasRPCServer):
 
         self.assertTrue(False, 'request ID never found running!')
 
+    def _wait_for_task_elapsed(self, task_id, elapsed=1.0, timeout=10):
+        # wait until the task has been running for a while, so it's past
+        # compiling and executing its query.
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            result = self.query_ps(completed=False, active=True)
+            for row in result['rows']:
+                if row['task_id'] != task_id or row['state'] != 'running':
+                    continue
+                if row['elapsed'] >= elapsed:
+                    return row
+            time.sleep(0.05)
+
+        self.assertTrue(False, 'task never ran for {}s!'.format(elapsed))
+
     @mark.skipif(os.name == 'nt', reason='"kill" not supported on windows')
     @mark.flaky(rerun_filter=lambda *a, **kw: True)
     @use_profile('postgres')
@@ -589,7 +921,7 @@ class TestRPCServer(HasRPCServer):
         # the test above frequently kills the process during parsing of the
         # requested node. That's also a useful test, but we should test that
         # we cancel the in-progress sleep query.
-        time.sleep(3)
+        self._wait_for_task_elapsed(sleep_task_id)
 
         error_data = self.kill_and_assert(pg_sleeper, sleep_task_id, request_id)
         # we should have logs if we did anything
@@ -690,7 +1022,6 @@ class TestRPCServer(HasRPCServer):
 
     @use_profile('postgres')
     def test_compile_project_postgres(self):
-        self.run_dbt_with_vars(['seed'])
         result = self.query('compile_project').json()
         dct = self.assertIsResult(result)
         self.assertIn('results', dct)
@@ -704,7 +1035,6 @@ class TestRPCServer(HasRPCServer):
 
     @use_profile('postgres')
     def test_run_project_postgres(self):
-        self.run_dbt_with_vars(['seed'])
         result = self.query('run_project').json()
         dct = self.assertIsResult(result)
         self.assertIn('results', dct)
@@ -718,7 +1048,6 @@ class TestRPCServer(HasRPCServer):
 
     @use_profile('postgres')
     def test_test_project_postgres(self):
-        self.run_dbt_with_vars(['seed'])
         result = self.query('run_project').json()
         dct = self.assertIsResult(result)
         result = self.query('test_project').json()
@@ -735,14 +1064,18 @@ class TestRPCServer(HasRPCServer):
         time.sleep(0.5)
         elapsed = time.time() - started
 
+        delay = 0.05
         while elapsed < timeout:
-            status = self.assertIsResult(self.query('status').json())
-            if status['status'] == 'running':
+            status = self.assertIsResult(
+                _json(query_url(self.url, _STATUS_QUERY))
+            )
+            if status['status'] == 'ready':
                 return status
-            time.sleep(0.5)
+            time.sleep(delay)
+            delay = min(delay * 1.5, 0.5)
             elapsed = time.time() - started
 
-        status = self.assertIsResult(self.query('status').json())
+        status = self.assertIsResult(_json(query_url(self.url, _STATUS_QUERY)))
         if raise_on_timeout:
             self.assertEqual(
                 status['status'],
@@ -752,8 +1085,7 @@ class TestRPCServer(HasRPCServer):
         return status
 
     def assertRunning(self, sleepers):
-        sleeper_ps_result = self.query('ps', completed=False, active=True).json()
-        result = self.assertIsResult(sleeper_ps_result)
+        result = self.query_ps(completed=False, active=True)
         self.assertEqual(len(result['rows']), len(sleepers))
         result_map = {rd['request_id']: rd for rd in result['rows']}
         for _, _, request_id in sleepers:
@@ -836,7 +1168,11 @@ class TestRPCServerFailed(HasRPCServer):
 
     @use_profile('postgres')
     def test_postgres_status_error(self):
-        status = self.assertIsResult(self.query('status').json())
+        status_result, compile_result = self.query_batch(
+            ('status', None, {}),
+            ('compile', 'select 1 as id', {}),
+        )
+        status = self.assertIsResult(status_result)
         self.assertEqual(status['status'], 'error')
         self.assertIn('logs', status)
         logs = status['logs']
@@ -848,12 +1184,12 @@ class TestRPCServerFailed(HasRPCServer):
         self.assertIn('error', status)
         self.assertIn('message', status['error'])
 
-        compile_result = self.query('compile', 'select 1 as id').json()
         data = self.assertIsErrorWith(
             compile_result,
             10011,
             'RPC server failed to compile project, call the "status" method for compile status',
-            None)
+            None,
+            id_=2)
         self.assertIn('message', data)
         self.assertIn('Compilation warning: Invalid test config', str(data['message']))
 
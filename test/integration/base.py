@@ -27,6 +27,10 @@ from dbt.logger import GLOBAL_LOGGER as logger, log_manager
 INITIAL_ROOT = os.getcwd()
 
 
+# pytest-xdist sets this in each of its worker processes
+XDIST_WORKER = os.environ.get('PYTEST_XDIST_WORKER', '')
+
+
 def normalize(path):
     """On windows, neither is enough on its own:
 
@@ -106,7 +110,9 @@ class DBTIntegrationTest(unittest.TestCase):
     CREATE_SCHEMA_STATEMENT = 'CREATE SCHEMA {}'
     DROP_SCHEMA_STATEMENT = 'DROP SCHEMA IF EXISTS {} CASCADE'
 
-    prefix = "test{}{:04}".format(int(time.time()), random.randint(0, 9999))
+    prefix = "test{}{:04}{}".format(
+        int(time.time()), random.randint(0, 9999), XDIST_WORKER
+    )
     setup_alternate_db = False
 
     @property